@@ -0,0 +1,141 @@
+'''
+generate synthetic archlinuxcn/repo-like package trees for benchmarking
+'''
+
+from __future__ import annotations
+
+import json
+import random
+import dataclasses
+import itertools
+from bisect import bisect_left
+from pathlib import Path
+
+@dataclasses.dataclass
+class RepoParams:
+  packages: int = 1000
+  # fraction of pkgbases that build more than one package
+  split_ratio: float = 0.1
+  # average number of repo_depends per pkgbase
+  fan_out: float = 1.0
+  # how concentrated repo_depends are on a few popular packages;
+  # 0 means uniform
+  fan_in_skew: float = 1.2
+  # fraction of pkgbases without maintainers
+  orphan_ratio: float = 0.05
+  maintainers: int = 300
+  seed: int = 0
+
+  def slug(self) -> str:
+    return '-'.join(f'{k}{v}' for k, v in dataclasses.asdict(self).items())
+
+def generate(repodir: Path, params: RepoParams) -> dict[str, list[str]]:
+  '''
+  Write the package tree into repodir and return {pkgbase: pkgnames}.
+
+  Every pkgbase gets a lilac.yaml and a PKGBUILD; about half of the split
+  ones also get a package.list. pkgname_map.json maps split pkgnames to
+  their pkgbases.
+  '''
+  rng = random.Random(params.seed)
+  repodir.mkdir(parents=True, exist_ok=True)
+
+  pkgbases = [f'synth-{i:05d}' for i in range(params.packages)]
+  maintainers = [f'user{i}' for i in range(params.maintainers)]
+  # a package can only depend on ones created before it, like in real life
+  cum_weights = list(itertools.accumulate(
+    1 / (i + 1) ** params.fan_in_skew for i in range(params.packages)))
+
+  pkgnames: dict[str, list[str]] = {}
+  pkgname_map = {}
+  for i, pkgbase in enumerate(pkgbases):
+    if rng.random() < params.split_ratio:
+      names = [f'{pkgbase}-{suffix}' for suffix in ['lib', 'bin', 'doc'][:rng.randint(2, 3)]]
+      for name in names:
+        pkgname_map[name] = pkgbase
+    else:
+      names = [pkgbase]
+    pkgnames[pkgbase] = names
+
+    deps = set()
+    if i > 0:
+      n = min(i, round(rng.expovariate(1 / params.fan_out)) if params.fan_out > 0 else 0)
+      while len(deps) < n:
+        x = rng.random() * cum_weights[i - 1]
+        deps.add(pkgbases[bisect_left(cum_weights, x, hi=i - 1)])
+
+    if rng.random() < params.orphan_ratio:
+      maints = []
+    else:
+      maints = rng.sample(maintainers, rng.randint(1, 3))
+
+    d = repodir / pkgbase
+    d.mkdir(exist_ok=True)
+    lines = [
+      'maintainers:',
+      *(f'  - github: {m}' for m in maints),
+    ]
+    if not maints:
+      lines[0] = 'maintainers: []'
+    lines += [
+      '',
+      'update_on:',
+      '  - source: github',
+      f'    github: example/{pkgbase}',
+    ]
+    if deps:
+      lines += ['', 'repo_depends:']
+      lines += [f'  - {x}' for x in sorted(deps)]
+    (d / 'lilac.yaml').write_text('\n'.join(lines) + '\n')
+
+    if len(names) > 1:
+      body = [f'pkgbase={pkgbase}', f'pkgname=({" ".join(names)})']
+      body += [f'package_{n}() {{\n  true\n}}\n' for n in names]
+      if rng.random() < 0.5:
+        (d / 'package.list').write_text('\n'.join(names) + '\n')
+    else:
+      body = [f'pkgname={pkgbase}', 'package() {\n  true\n}\n']
+    (d / 'PKGBUILD').write_text(
+      'pkgver=1.0\npkgrel=1\narch=(any)\n' + '\n'.join(body))
+
+  with open(repodir / 'pkgname_map.json', 'w') as f:
+    json.dump(pkgname_map, f)
+
+  return pkgnames
+
+def load_or_generate(repodir: Path, params: RepoParams) -> dict[str, list[str]]:
+  '''reuse a repo generated earlier with the same parameters'''
+  marker = repodir / '.synthrepo.json'
+  try:
+    with open(marker) as f:
+      info = json.load(f)
+    if info['params'] == dataclasses.asdict(params):
+      return info['pkgnames']
+  except FileNotFoundError:
+    pass
+
+  pkgnames = generate(repodir, params)
+  with open(marker, 'w') as f:
+    json.dump({'params': dataclasses.asdict(params), 'pkgnames': pkgnames}, f)
+  return pkgnames
+
+def main() -> None:
+  import argparse
+
+  parser = argparse.ArgumentParser(description=__doc__)
+  parser.add_argument('repodir', type=Path)
+  for f in dataclasses.fields(RepoParams):
+    parser.add_argument(
+      '--' + f.name.replace('_', '-'),
+      type=type(f.default), default=f.default,
+    )
+  args = parser.parse_args()
+
+  params = RepoParams(**{
+    f.name: getattr(args, f.name) for f in dataclasses.fields(RepoParams)
+  })
+  pkgnames = generate(args.repodir, params)
+  print(f'{len(pkgnames)} pkgbases, {sum(len(v) for v in pkgnames.values())} packages generated.')
+
+if __name__ == '__main__':
+  main()
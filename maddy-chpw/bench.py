@@ -0,0 +1,155 @@
+#!/usr/bin/python3
+
+'''
+Benchmark the login and submit paths against local stand-ins for GitHub,
+the database and maddy. Run it in this directory; config.py isn't needed.
+'''
+
+import asyncio
+import os
+import sys
+import stat
+import tempfile
+import time
+import types
+from contextlib import asynccontextmanager
+
+from aiohttp import web
+import aiohttp
+from cryptography import fernet
+
+GH_PORT = 9108
+APP_PORT = 9109
+
+FAKE_MADDY = '''\
+#!/bin/sh
+cat > /dev/null
+sleep {delay}
+'''
+
+class FakeConn:
+  @asynccontextmanager
+  async def transaction(self):
+    yield
+
+  async def execute(self, query, *args):
+    pass
+
+class FakePool:
+  async def fetchrow(self, query, username):
+    return (username.lower(), False)
+
+  @asynccontextmanager
+  async def acquire(self):
+    yield FakeConn()
+
+  async def close(self):
+    pass
+
+def github_standin():
+  async def access_token(request):
+    return web.json_response({'access_token': 'token'})
+
+  async def orgs(request):
+    return web.json_response([{'login': 'archlinuxcn'}])
+
+  async def user(request):
+    return web.json_response({'login': 'someone'})
+
+  app = web.Application()
+  app.router.add_post('/login/oauth/access_token', access_token)
+  app.router.add_get('/user/orgs', orgs)
+  app.router.add_get('/user', user)
+  return app
+
+async def run(name, n, concurrency, fn):
+  sem = asyncio.Semaphore(concurrency)
+  latencies = []
+
+  async def one():
+    async with sem:
+      t = time.perf_counter()
+      await fn()
+      latencies.append(time.perf_counter() - t)
+
+  t = time.perf_counter()
+  await asyncio.gather(*(one() for _ in range(n)))
+  elapsed = time.perf_counter() - t
+  latencies.sort()
+  p50 = latencies[len(latencies) // 2] * 1000
+  p99 = latencies[int(len(latencies) * 0.99)] * 1000
+  print(f'{name:8} {n / elapsed:8.1f} req/s  p50 {p50:7.1f}ms  p99 {p99:7.1f}ms')
+
+async def main(args):
+  tmpdir = tempfile.TemporaryDirectory()
+  maddy = os.path.join(tmpdir.name, 'maddy')
+  with open(maddy, 'w') as f:
+    f.write(FAKE_MADDY.format(delay=args.maddy_delay))
+  os.chmod(maddy, stat.S_IRWXU)
+
+  config = types.ModuleType('config')
+  config.FERNET_KEY = fernet.Fernet.generate_key()
+  config.DB_URL = None
+  config.CLIENT_ID = 'client'
+  config.CLIENT_SECRET = 'secret'
+  config.TARGET_ORG = 'archlinuxcn'
+  config.GITHUB_URL = config.GITHUB_API = f'http://127.0.0.1:{GH_PORT}'
+  config.MADDY = maddy
+  sys.modules['config'] = config
+  import main as chpw
+
+  async def init_fake_db(app):
+    app[chpw.KEY_DB] = FakePool()
+    yield
+
+  app = web.Application()
+  chpw.setup_app(app)
+  app.cleanup_ctx[app.cleanup_ctx.index(chpw.init_db)] = init_fake_db
+
+  runners = []
+  for a, port in [(github_standin(), GH_PORT), (app, APP_PORT)]:
+    runner = web.AppRunner(a, access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, '127.0.0.1', port).start()
+    runners.append(runner)
+
+  base = f'http://127.0.0.1:{APP_PORT}'
+  async with aiohttp.ClientSession() as s:
+    async def login():
+      async with s.get(f'{base}/mail/login?code=x', allow_redirects=False) as r:
+        assert r.status == 302, r.status
+        return r.headers['Set-Cookie'].split(';', 1)[0]
+
+    # the session cookie is "secure", so send it by hand over plain http
+    cookie = await login()
+
+    async def submit():
+      async with s.post(
+        f'{base}/mail/chpw', data={'password': 'x'},
+        headers={'Cookie': cookie},
+      ) as r:
+        assert r.status == 200, r.status
+
+    async def index():
+      async with s.get(f'{base}/mail/chpw', headers={'Cookie': cookie}) as r:
+        assert r.status == 200, r.status
+
+    await run('login', args.n, args.concurrency, login)
+    await run('submit', args.n, args.concurrency, submit)
+    await run('index', args.n, args.concurrency, index)
+
+  for runner in runners:
+    await runner.cleanup()
+  tmpdir.cleanup()
+
+if __name__ == '__main__':
+  import argparse
+
+  parser = argparse.ArgumentParser(description=__doc__)
+  parser.add_argument('-n', type=int, default=500,
+                      help='requests per path')
+  parser.add_argument('-c', '--concurrency', type=int, default=50)
+  parser.add_argument('--maddy-delay', type=float, default=0.05,
+                      help='how long the fake maddy takes')
+  args = parser.parse_args()
+  asyncio.run(main(args))
@@ -1,6 +1,8 @@
 #!/usr/bin/python3
 
 import logging
+import asyncio
+import os
 import subprocess
 
 import aiohttp
@@ -14,26 +16,51 @@ import asyncpg
 import config
 
 logger = logging.getLogger(__name__)
+
+GITHUB_URL = getattr(config, 'GITHUB_URL', 'https://github.com')
+GITHUB_API = getattr(config, 'GITHUB_API', 'https://api.github.com')
+MADDY = getattr(config, 'MADDY', 'maddy')
+# how many maddy commands may run at the same time, and for how long
+MADDY_CONCURRENCY = getattr(config, 'MADDY_CONCURRENCY', 2)
+MADDY_TIMEOUT = getattr(config, 'MADDY_TIMEOUT', 30)
+
+class Template:
+  '''a file read once and again only when it changes'''
+
+  def __init__(self, path):
+    self.path = path
+    self.mtime = None
+    self.content = None
+
+  def get(self):
+    st = os.stat(self.path)
+    if st.st_mtime_ns != self.mtime:
+      with open(self.path) as f:
+        self.content = f.read()
+      self.mtime = st.st_mtime_ns
+    return self.content
+
 KEY_DB = web.AppKey('db', asyncpg.Pool)
+KEY_HTTP = web.AppKey('http', aiohttp.ClientSession)
+KEY_MADDY_SEM = web.AppKey('maddy_sem', asyncio.Semaphore)
+
+INDEX = Template('index.html')
+INDEX_LOGGEDIN = Template('index-loggedin.html')
 
 async def index(request):
   session = await get_session(request)
   username = session.get('username')
   if not username:
-    with open('index.html', 'rb') as f:
-      body = f.read()
     return web.Response(
-      body = body,
+      text = INDEX.get(),
       content_type = 'text/html',
       charset = 'utf-8',
     )
 
   db = request.app[KEY_DB]
   mailaddr, _new = await get_mailinfo(db, username)
-  with open('index-loggedin.html') as f:
-    body = f.read()
   return web.Response(
-    text = body.format(username=username, mailaddr=f'{mailaddr}@archlinuxcn.org'),
+    text = INDEX_LOGGEDIN.get().format(username=username, mailaddr=f'{mailaddr}@archlinuxcn.org'),
     content_type = 'text/html',
     charset = 'utf-8',
   )
@@ -41,45 +68,45 @@ async def index(request):
 async def github_login(request):
   code = request.query.get('code')
   if not code:
-    url = URL('https://github.com/login/oauth/authorize') % {
+    url = URL(f'{GITHUB_URL}/login/oauth/authorize') % {
       'client_id': config.CLIENT_ID,
       'redirect_uri': f'https://{request.host}/mail/login',
       'scope': 'read:org',
     }
     raise web.HTTPFound(str(url))
 
-  async with aiohttp.ClientSession() as session:
-    url = 'https://github.com/login/oauth/access_token'
-    data = {
-      'client_id': config.CLIENT_ID,
-      'client_secret': config.CLIENT_SECRET,
-      'code': code,
-    }
-    headers = {
-      'Accept': 'application/json',
-    }
-    async with session.post(url, data=data, headers=headers) as res:
-      j = await res.json()
-      access_token = j['access_token']
-
-    url = 'https://api.github.com/user/orgs'
-    headers = {
-      'Accept': 'application/vnd.github+json',
-      'Authorization': f'Bearer {access_token}',
-      'X-GitHub-Api-Version': '2022-11-28',
-    }
-    async with session.get(url, headers=headers) as res:
-      j = await res.json()
-      orgs = [o['login'] for o in j]
-      if config.TARGET_ORG not in orgs:
-        raise web.HTTPForbidden()
-
-    url = 'https://api.github.com/user'
-    async with session.get(url, headers=headers) as res:
-      j = await res.json()
-      username = j['login']
-    session = await new_session(request)
-    session['username'] = username
+  http = request.app[KEY_HTTP]
+  url = f'{GITHUB_URL}/login/oauth/access_token'
+  data = {
+    'client_id': config.CLIENT_ID,
+    'client_secret': config.CLIENT_SECRET,
+    'code': code,
+  }
+  headers = {
+    'Accept': 'application/json',
+  }
+  async with http.post(url, data=data, headers=headers) as res:
+    j = await res.json()
+    access_token = j['access_token']
+
+  url = f'{GITHUB_API}/user/orgs'
+  headers = {
+    'Accept': 'application/vnd.github+json',
+    'Authorization': f'Bearer {access_token}',
+    'X-GitHub-Api-Version': '2022-11-28',
+  }
+  async with http.get(url, headers=headers) as res:
+    j = await res.json()
+    orgs = [o['login'] for o in j]
+    if config.TARGET_ORG not in orgs:
+      raise web.HTTPForbidden()
+
+  url = f'{GITHUB_API}/user'
+  async with http.get(url, headers=headers) as res:
+    j = await res.json()
+    username = j['login']
+  session = await new_session(request)
+  session['username'] = username
 
   raise web.HTTPFound('/mail/chpw')
 
@@ -97,42 +124,63 @@ async def submit(request):
   db = request.app[KEY_DB]
   mailaddr, new = await get_mailinfo(db, username)
   logger.info('%s wants to change password for %s (new? %s).', username, mailaddr, new)
-  await chpw(db, mailaddr, newpass, new)
+  await chpw(db, request.app[KEY_MADDY_SEM], mailaddr, newpass, new)
 
   return web.Response(text='OK')
 
 async def get_mailinfo(db, username):
-  async with db.acquire() as conn, conn.transaction():
-    rs = await conn.fetch('select mailname, new from mailinfo where github ilike $1', username)
-    if not rs:
-      raise web.HTTPNotFound(reason='user not found in database')
-
-    return rs[0]
-
-async def chpw(db, addr, newpass, new):
+  r = await db.fetchrow('select mailname, new from mailinfo where github ilike $1', username)
+  if not r:
+    raise web.HTTPNotFound(reason='user not found in database')
+
+  return r
+
+async def run_maddy(sem, args, input=None):
+  cmd = [MADDY, *args]
+  async with sem:
+    p = await asyncio.create_subprocess_exec(
+      *cmd,
+      stdin = subprocess.PIPE if input is not None else subprocess.DEVNULL,
+    )
+    try:
+      await asyncio.wait_for(p.communicate(input), MADDY_TIMEOUT)
+    except asyncio.TimeoutError:
+      p.kill()
+      await p.wait()
+      raise
+  if p.returncode != 0:
+    raise subprocess.CalledProcessError(p.returncode, cmd)
+
+async def chpw(db, sem, addr, newpass, new):
   newpass = newpass.encode()
   mailaddr = f'{addr}@archlinuxcn.org'
   if new:
-    cmd = ['maddy', 'creds', 'create', mailaddr]
-    subprocess.run(cmd, input=newpass, check=True)
-    cmd = ['maddy', 'imap-acct', 'create', mailaddr]
-    subprocess.run(cmd, check=True)
+    await run_maddy(sem, ['creds', 'create', mailaddr], input=newpass)
+    await run_maddy(sem, ['imap-acct', 'create', mailaddr])
     async with db.acquire() as conn, conn.transaction():
       await conn.execute('update mailinfo set new = false where mailname = $1', addr)
   else:
-    cmd = ['maddy', 'creds', 'password', mailaddr]
-    subprocess.run(cmd, input=newpass, check=True)
+    await run_maddy(sem, ['creds', 'password', mailaddr], input=newpass)
 
 async def init_db(app):
   app[KEY_DB] = await asyncpg.create_pool(config.DB_URL, setup=conn_init, min_size=0)
   yield
   await app[KEY_DB].close()
 
+async def init_http(app):
+  app[KEY_HTTP] = aiohttp.ClientSession(
+    timeout = aiohttp.ClientTimeout(total=30),
+  )
+  app[KEY_MADDY_SEM] = asyncio.Semaphore(MADDY_CONCURRENCY)
+  yield
+  await app[KEY_HTTP].close()
+
 async def conn_init(conn):
   await conn.execute("set search_path to 'mailusers'")
 
 def setup_app(app):
   app.cleanup_ctx.append(init_db)
+  app.cleanup_ctx.append(init_http)
 
   f = fernet.Fernet(config.FERNET_KEY)
   setup(app, EncryptedCookieStorage(
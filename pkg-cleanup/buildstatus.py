@@ -0,0 +1,90 @@
+'''
+consecutive build failures per pkgbase, from lilac's pkglog table
+'''
+
+from __future__ import annotations
+
+import logging
+from typing import Optional, TYPE_CHECKING
+if TYPE_CHECKING:
+  import datetime
+
+from psycopg2 import sql
+
+logger = logging.getLogger(__name__)
+
+BuildStatus = tuple[int, Optional[int]]
+
+# For every row, count the non-failed builds at or after it. The rows where
+# that is zero are the trailing run of failures.
+_QUERY = '''
+select pkgbase,
+       count(*) filter (where ok_since = 0),
+       min(ts) filter (where ok_since = 0)
+from (
+  select pkgbase, ts,
+         count(*) filter (where result <> 'failed') over (
+           partition by pkgbase order by ts desc
+           rows between unbounded preceding and current row
+         ) as ok_since
+  from {table}
+  where pkgbase = any(%s)
+) t
+group by pkgbase
+'''
+
+def load_build_status_count(
+  conn,
+  pkgs: list[str],
+  now: datetime.datetime,
+  table: str = 'lilac.pkglog',
+) -> dict[str, BuildStatus]:
+  '''
+  Return (number of failures since the last non-failed build, days since the
+  oldest of them) for each pkgbase in the table. Only one row per pkgbase
+  leaves the server.
+  '''
+  query = sql.SQL(_QUERY).format(
+    table=sql.Identifier(*table.split('.')))
+
+  logger.info('loading build status from Postgres...')
+  ret: dict[str, BuildStatus] = {}
+  with conn:
+    with conn.cursor(name='build_status') as cursor:
+      cursor.itersize = 10000
+      cursor.execute(query, (pkgs,))
+      for pkgbase, count, oldest in cursor:
+        days = (now - oldest).days if count else None
+        ret[pkgbase] = count, days
+  logger.info('loaded build status for %d packages.', len(ret))
+
+  return ret
+
+def load_build_status_count_client(
+  conn,
+  pkgs: list[str],
+  now: datetime.datetime,
+  table: str = 'lilac.pkglog',
+) -> dict[str, BuildStatus]:
+  '''the old way: fetch all rows and count in Python (for benchmarking)'''
+  from itertools import groupby, takewhile
+
+  query = sql.SQL(
+    'select pkgbase, ts, result from {table} where pkgbase = any(%s) order by pkgbase, ts desc'
+  ).format(table=sql.Identifier(*table.split('.')))
+
+  with conn:
+    cursor = conn.cursor()
+    cursor.execute(query, (pkgs,))
+    rows = cursor.fetchall()
+
+  pkg_to_result = {}
+  for k, g in groupby(rows, key=lambda row: row[0]):
+    rs = list(takewhile(lambda row: row[2] == 'failed', g))
+    if rs:
+      days = (now - rs[-1][1]).days
+    else:
+      days = None
+    pkg_to_result[k] = len(rs), days
+
+  return pkg_to_result
@@ -0,0 +1,139 @@
+'''
+SQLite storage for gen-cleanup-list: the stats cache and the gathered data
+'''
+
+from __future__ import annotations
+
+import sqlite3
+import time
+import logging
+from typing import Optional, Any
+
+logger = logging.getLogger(__name__)
+
+DB_FILE = 'cleanup.db'
+
+_SCHEMA = '''
+create table if not exists dl_count (
+  name text primary key,
+  since integer not null,
+  count integer not null,
+  fetched_at real not null
+);
+
+create table if not exists pkgstats (
+  name text not null,
+  start_month text not null,
+  end_month text not null,
+  count integer not null,
+  samples integer not null,
+  fetched_at real not null,
+  primary key (name, start_month, end_month)
+);
+
+create table if not exists pkginfo (
+  pkgbase text primary key,
+  dl_count integer not null,
+  stats_count integer not null,
+  stats_samples integer not null,
+  fail_count integer,
+  fail_since integer
+);
+
+create table if not exists maintainer (
+  github text not null,
+  pkgbase text not null references pkginfo (pkgbase) on delete cascade,
+  primary key (github, pkgbase)
+);
+'''
+
+def connect(path: str = DB_FILE) -> sqlite3.Connection:
+  db = sqlite3.connect(path)
+  # WAL lets queries run while a gather is writing
+  db.execute('pragma journal_mode = wal')
+  db.execute('pragma foreign_keys = on')
+  db.executescript(_SCHEMA)
+  return db
+
+class StatsCache:
+  '''
+  Cache of fetched download counts and pkgstats info.
+
+  Every entry records when it was fetched. Entries older than `ttl` seconds,
+  or fetched for a different stats window, are treated as missing, so a new
+  cleanup never sees counts from an old one. Writes are committed every
+  `commit_every` seconds, so an interrupted gather loses at most that much.
+  '''
+
+  def __init__(
+    self,
+    db: sqlite3.Connection,
+    ttl: float,
+    commit_every: float = 10.0,
+  ) -> None:
+    self.db = db
+    self.ttl = ttl
+    self.commit_every = commit_every
+    self._last_commit = time.monotonic()
+
+  def __enter__(self) -> StatsCache:
+    return self
+
+  def __exit__(self, *exc_info: Any) -> None:
+    self.db.commit()
+
+  def _valid_after(self) -> float:
+    return time.time() - self.ttl
+
+  def _maybe_commit(self) -> None:
+    now = time.monotonic()
+    if now - self._last_commit >= self.commit_every:
+      self.db.commit()
+      self._last_commit = now
+
+  def get_dl_count(self, name: str, since: int) -> Optional[int]:
+    # "since" moves with the clock; a window that started within ttl of ours
+    # is close enough
+    r = self.db.execute(
+      'select count from dl_count where name = ? and fetched_at > ? and since >= ?',
+      (name, self._valid_after(), since - self.ttl),
+    ).fetchone()
+    return r[0] if r else None
+
+  def set_dl_count(self, name: str, since: int, count: int) -> None:
+    self.db.execute(
+      'insert or replace into dl_count (name, since, count, fetched_at) values (?, ?, ?, ?)',
+      (name, since, count, time.time()),
+    )
+    self._maybe_commit()
+
+  def get_stats_info(
+    self, name: str, start_month: str, end_month: str,
+  ) -> Optional[tuple[int, int]]:
+    r = self.db.execute(
+      '''select count, samples from pkgstats
+         where name = ? and start_month = ? and end_month = ? and fetched_at > ?''',
+      (name, start_month, end_month, self._valid_after()),
+    ).fetchone()
+    return (r[0], r[1]) if r else None
+
+  def set_stats_info(
+    self, name: str, start_month: str, end_month: str,
+    info: tuple[int, int],
+  ) -> None:
+    self.db.execute(
+      '''insert or replace into pkgstats
+         (name, start_month, end_month, count, samples, fetched_at)
+         values (?, ?, ?, ?, ?, ?)''',
+      (name, start_month, end_month, info[0], info[1], time.time()),
+    )
+    self._maybe_commit()
+
+  def expire(self) -> None:
+    '''drop entries that can no longer be used'''
+    t = self._valid_after()
+    with self.db:
+      n = self.db.execute('delete from dl_count where fetched_at <= ?', (t,)).rowcount
+      n += self.db.execute('delete from pkgstats where fetched_at <= ?', (t,)).rowcount
+    if n:
+      logger.info('expired %d cache entries.', n)
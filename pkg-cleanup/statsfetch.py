@@ -0,0 +1,217 @@
+'''
+concurrent, rate-limited fetching of download counts and pkgstats data
+'''
+
+from __future__ import annotations
+
+import asyncio
+import logging
+import random
+import time
+from typing import Any, Awaitable, Callable, Optional
+from urllib.parse import urlsplit
+import email.utils
+
+import aiohttp
+
+logger = logging.getLogger(__name__)
+
+DL_COUNT_URL = 'https://archlinuxcn-pkgstats.imlonghao.workers.dev/'
+PKGSTATS_URL = 'https://pkgstats.archlinux.de/api/packages/'
+
+# host: (max concurrent requests, requests per second, burst)
+HostLimit = tuple[int, float, int]
+HOST_LIMITS: dict[str, HostLimit] = {
+  'archlinuxcn-pkgstats.imlonghao.workers.dev': (16, 20.0, 20),
+  'pkgstats.archlinux.de': (4, 5.0, 5),
+}
+DEFAULT_HOST_LIMIT: HostLimit = (8, 10.0, 10)
+
+class FetchError(Exception):
+  pass
+
+class _Retry(Exception):
+  def __init__(self, reason: str, after: Optional[float] = None) -> None:
+    super().__init__(reason)
+    self.after = after
+
+class TokenBucket:
+  def __init__(self, rate: float, burst: int) -> None:
+    self.rate = rate
+    self.capacity = float(burst)
+    self.tokens = float(burst)
+    self.last = time.monotonic()
+    self.paused_until = 0.0
+    self.lock = asyncio.Lock()
+
+  def _refill(self) -> None:
+    now = time.monotonic()
+    self.tokens = min(
+      self.capacity, self.tokens + (now - self.last) * self.rate)
+    self.last = now
+
+  async def acquire(self) -> None:
+    # waiters queue up on the lock so tokens are handed out in order
+    async with self.lock:
+      while True:
+        if (wait := self.paused_until - time.monotonic()) > 0:
+          await asyncio.sleep(wait)
+          continue
+        self._refill()
+        if self.tokens >= 1:
+          self.tokens -= 1
+          return
+        await asyncio.sleep((1 - self.tokens) / self.rate)
+
+  def pause(self, seconds: float) -> None:
+    '''stop handing out tokens for about this many seconds'''
+    # concurrent 429s with the same Retry-After shouldn't add up
+    self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+    self._refill()
+    self.tokens = min(self.tokens, 0.0)
+
+class _Host:
+  def __init__(self, limit: HostLimit) -> None:
+    concurrency, rate, burst = limit
+    self.sem = asyncio.Semaphore(concurrency)
+    self.bucket = TokenBucket(rate, burst)
+
+def _parse_retry_after(v: Optional[str]) -> Optional[float]:
+  if not v:
+    return None
+  try:
+    return max(0.0, float(v))
+  except ValueError:
+    pass
+  try:
+    dt = email.utils.parsedate_to_datetime(v)
+  except (TypeError, ValueError):
+    return None
+  return max(0.0, dt.timestamp() - time.time())
+
+class StatsFetcher:
+  '''
+  Fetch download counts and pkgstats info concurrently.
+
+  Requests are limited per host both in concurrency and in rate (token
+  bucket), retried with jittered exponential backoff, and deduplicated:
+  asking for the same package twice (e.g. from split packages) results in
+  only one request.
+
+  The endpoint URLs can be pointed to a local stand-in server for testing.
+  '''
+
+  def __init__(
+    self, *,
+    dl_count_url: str = DL_COUNT_URL,
+    pkgstats_url: str = PKGSTATS_URL,
+    host_limits: Optional[dict[str, HostLimit]] = None,
+    attempts: int = 5,
+    backoff_base: float = 1.0,
+    backoff_cap: float = 60.0,
+    timeout: float = 30.0,
+  ) -> None:
+    if attempts < 1:
+      raise ValueError('attempts must be at least 1')
+
+    self.dl_count_url = dl_count_url
+    self.pkgstats_url = pkgstats_url.rstrip('/') + '/'
+    self.host_limits = HOST_LIMITS | (host_limits or {})
+    self.attempts = attempts
+    self.backoff_base = backoff_base
+    self.backoff_cap = backoff_cap
+    self.timeout = aiohttp.ClientTimeout(total=timeout)
+
+    self._hosts: dict[str, _Host] = {}
+    self._tasks: dict[tuple[str, ...], asyncio.Future[Any]] = {}
+    self._session: Optional[aiohttp.ClientSession] = None
+    self.requests_made = 0
+
+  async def __aenter__(self) -> StatsFetcher:
+    self._session = aiohttp.ClientSession(timeout=self.timeout)
+    return self
+
+  async def __aexit__(self, *exc_info: Any) -> None:
+    for t in self._tasks.values():
+      t.cancel()
+    if self._session is not None:
+      await self._session.close()
+      self._session = None
+
+  def _host(self, host: str) -> _Host:
+    h = self._hosts.get(host)
+    if h is None:
+      limit = self.host_limits.get(host, DEFAULT_HOST_LIMIT)
+      h = self._hosts[host] = _Host(limit)
+    return h
+
+  def _backoff(self, attempt: int) -> float:
+    # "full jitter"
+    return random.uniform(
+      0, min(self.backoff_cap, self.backoff_base * 2 ** attempt))
+
+  async def _get_json(self, url: str, params: dict[str, str]) -> Any:
+    assert self._session is not None, 'use StatsFetcher as an async context manager'
+    host = self._host(urlsplit(url).hostname or '')
+
+    for attempt in range(self.attempts):
+      await host.bucket.acquire()
+      try:
+        async with host.sem:
+          self.requests_made += 1
+          async with self._session.get(url, params=params) as r:
+            if r.status == 429 or r.status >= 500:
+              raise _Retry(
+                f'HTTP {r.status}',
+                _parse_retry_after(r.headers.get('Retry-After')),
+              )
+            if r.status >= 400:
+              raise FetchError(f'{url} {params}: HTTP {r.status}')
+            return await r.json(content_type=None)
+      except (_Retry, aiohttp.ClientError, asyncio.TimeoutError, ValueError) as e:
+        after = e.after if isinstance(e, _Retry) else None
+        if attempt == self.attempts - 1:
+          raise FetchError(
+            f'{url} {params}: giving up after {self.attempts} attempts: {e!r}') from e
+        delay = self._backoff(attempt)
+        if after is not None:
+          # the server asked us to slow down; make the whole host wait
+          host.bucket.pause(after)
+          delay = max(delay, after)
+        logger.warning('%s %s failed (%r), retry #%d in %.1fs',
+                       url, params, e, attempt + 1, delay)
+        await asyncio.sleep(delay)
+
+    raise AssertionError('not reached')
+
+  async def _once(
+    self, key: tuple[str, ...], fn: Callable[[], Awaitable[Any]],
+  ) -> Any:
+    fut = self._tasks.get(key)
+    if fut is None or (
+      fut.done() and (fut.cancelled() or fut.exception() is not None)
+    ):
+      fut = self._tasks[key] = asyncio.ensure_future(fn())
+    # one waiter being cancelled shouldn't cancel the shared request
+    return await asyncio.shield(fut)
+
+  async def get_dl_count(self, name: str, since: int) -> int:
+    async def fetch() -> int:
+      j = await self._get_json(self.dl_count_url, {
+        'name': name,
+        'timegt': str(since),
+      })
+      return j['count']
+    return await self._once(('dl_count', name, str(since)), fetch)
+
+  async def get_stats_info(
+    self, name: str, start_month: str, end_month: str,
+  ) -> tuple[int, int]:
+    async def fetch() -> tuple[int, int]:
+      j = await self._get_json(self.pkgstats_url + name, {
+        'startMonth': start_month,
+        'endMonth': end_month,
+      })
+      return j['count'], j['samples']
+    return await self._once(
+      ('pkgstats', name, start_month, end_month), fetch)
@@ -0,0 +1,226 @@
+'''
+cached lilac.yaml parsing for scripts that walk the whole repository
+
+Only the fields those scripts use are kept (maintainers, repo_depends and
+package names). Package names are kept even if lilac.yaml is broken, for
+scripts that only need them. An entry is reused as long as lilac.yaml, PKGBUILD and
+package.list have the same mtime and size. The cache file is replaced
+atomically, so processes can share it; if two of them write at the same
+time, one's updates are lost and simply recomputed later.
+'''
+
+from __future__ import annotations
+
+import os
+import pickle
+import hashlib
+import tempfile
+import logging
+from pathlib import Path
+from typing import NamedTuple, Optional, Iterator, Any, Callable, TypeVar
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar('T')
+
+_VERSION = 2
+_WATCHED_FILES = ('lilac.yaml', 'PKGBUILD', 'package.list')
+
+class LilacInfo(NamedTuple):
+  pkgbase: str
+  # GitHub logins
+  maintainers: list[str]
+  # (pkgbase, repo) like lilac2 gives
+  repo_depends: list[tuple[str, str]]
+  pkgnames: list[str]
+
+class LilacYamlError(Exception):
+  '''the package (or only its package names, see get_pkgnames) can't be loaded'''
+
+  def __init__(self, pkgdir: Path, msg: str) -> None:
+    super().__init__(f'{pkgdir}: {msg}')
+    self.pkgdir = pkgdir
+
+_Key = tuple[Optional[tuple[int, int]], ...]
+class _Entry(NamedTuple):
+  key: _Key
+  info: Optional[LilacInfo]
+  # why info or pkgnames is None
+  err: Optional[str]
+  pkgnames: Optional[list[str]]
+
+def _stat_key(pkgdir: Path) -> _Key:
+  ret: list[Optional[tuple[int, int]]] = []
+  for name in _WATCHED_FILES:
+    try:
+      st = os.stat(pkgdir / name)
+    except FileNotFoundError:
+      ret.append(None)
+    else:
+      ret.append((st.st_mtime_ns, st.st_size))
+  return tuple(ret)
+
+def load_pkgnames(pkgdir: Path) -> list[str]:
+  from lilac2.packages import get_package_names
+  return [name for _, name in get_package_names(pkgdir)]
+
+def load_lilac_info(
+  pkgdir: Path, pkgnames: Optional[list[str]] = None,
+) -> LilacInfo:
+  '''read a package without the cache'''
+  from lilac2.lilacyaml import load_lilac_yaml
+
+  ly = load_lilac_yaml(pkgdir)
+  return LilacInfo(
+    pkgbase = pkgdir.name,
+    maintainers = [
+      x['github'] for x in ly.get('maintainers') or ()
+      if 'github' in x
+    ],
+    repo_depends = [tuple(x) for x in ly.get('repo_depends') or ()], # type: ignore
+    pkgnames = load_pkgnames(pkgdir) if pkgnames is None else pkgnames,
+  )
+
+def default_cachefile(repodir: Path) -> Path:
+  cachedir = os.environ.get('LILACCACHE_DIR') or os.path.join(
+    os.environ.get('XDG_CACHE_HOME') or os.path.expanduser('~/.cache'),
+    'lilaccache',
+  )
+  h = hashlib.sha1(str(repodir.resolve()).encode()).hexdigest()[:16]
+  return Path(cachedir) / f'{repodir.name}-{h}.pickle'
+
+class LilacCache:
+  def __init__(
+    self, repodir: Path, cachefile: Optional[Path] = None,
+  ) -> None:
+    self.repodir = Path(repodir)
+    self.cachefile = cachefile or default_cachefile(self.repodir)
+    self.entries: dict[str, _Entry] = self._load()
+    self.dirty = False
+    self.hits = self.misses = 0
+
+  def _load(self) -> dict[str, _Entry]:
+    try:
+      with open(self.cachefile, 'rb') as f:
+        version, entries = pickle.load(f)
+    except FileNotFoundError:
+      return {}
+    except Exception as e:
+      logger.warning('ignoring bad cache file %s: %r', self.cachefile, e)
+      return {}
+    if version != _VERSION:
+      return {}
+    return {k: _Entry(key, LilacInfo(*info) if info else None, err, pkgnames)
+            for k, (key, info, err, pkgnames) in entries.items()}
+
+  def save(self) -> None:
+    if not self.dirty:
+      return
+    self.cachefile.parent.mkdir(parents=True, exist_ok=True)
+    # plain tuples load faster than NamedTuples
+    data = (_VERSION, {
+      k: (key, tuple(info) if info else None, err, pkgnames)
+      for k, (key, info, err, pkgnames) in self.entries.items()
+    })
+    fd, tmp = tempfile.mkstemp(
+      dir=self.cachefile.parent, prefix=self.cachefile.name, suffix='.tmp')
+    try:
+      with os.fdopen(fd, 'wb') as f:
+        pickle.dump(data, f, protocol=pickle.HIGHEST_PROTOCOL)
+      os.replace(tmp, self.cachefile)
+    except BaseException:
+      os.unlink(tmp)
+      raise
+    self.dirty = False
+
+  def __enter__(self) -> LilacCache:
+    return self
+
+  def __exit__(self, *exc_info: Any) -> None:
+    self.save()
+
+  def _entry(self, pkgdir: Path) -> _Entry:
+    name = pkgdir.name
+    key = _stat_key(pkgdir)
+    entry = self.entries.get(name)
+    if entry is not None and entry.key == key:
+      self.hits += 1
+      return entry
+
+    self.misses += 1
+    info = pkgnames = err = None
+    try:
+      pkgnames = load_pkgnames(pkgdir)
+      info = load_lilac_info(pkgdir, pkgnames)
+    except Exception as e:
+      err = repr(e)
+    entry = _Entry(key, info, err, pkgnames)
+    self.entries[name] = entry
+    self.dirty = True
+    return entry
+
+  def get(self, pkgdir: Path) -> LilacInfo:
+    '''raise LilacYamlError if the package can't be loaded'''
+    entry = self._entry(pkgdir)
+    if entry.info is None:
+      raise LilacYamlError(pkgdir, entry.err or 'unknown error')
+    return entry.info
+
+  def get_pkgnames(self, pkgdir: Path) -> list[str]:
+    '''
+    Like get(pkgdir).pkgnames, but works with a broken lilac.yaml.
+
+    Raise LilacYamlError if the package names can't be determined.
+    '''
+    entry = self._entry(pkgdir)
+    if entry.pkgnames is None:
+      raise LilacYamlError(pkgdir, entry.err or 'unknown error')
+    return entry.pkgnames
+
+  def _iter(
+    self, get: Callable[[Path], T], ignore_errors: bool,
+  ) -> Iterator[tuple[Path, T]]:
+    from lilac2.lilacyaml import iter_pkgdir
+
+    seen = set()
+    for pkgdir in iter_pkgdir(self.repodir):
+      seen.add(pkgdir.name)
+      try:
+        yield pkgdir, get(pkgdir)
+      except LilacYamlError as e:
+        if not ignore_errors:
+          raise
+        logger.warning('skipping %s', e)
+
+    # forget removed packages
+    for name in self.entries.keys() - seen:
+      del self.entries[name]
+      self.dirty = True
+    logger.debug('lilac cache for %s: %d hits, %d misses',
+                 self.repodir, self.hits, self.misses)
+
+  def iter(self, ignore_errors: bool = False) -> Iterator[LilacInfo]:
+    '''like lilac2.lilacyaml.iter_pkgdir + load_lilac_yaml'''
+    for _, info in self._iter(self.get, ignore_errors):
+      yield info
+
+  def iter_pkgnames(
+    self, ignore_errors: bool = False,
+  ) -> Iterator[tuple[str, list[str]]]:
+    '''(pkgbase, pkgnames) for every package, including ones with a broken lilac.yaml'''
+    for pkgdir, pkgnames in self._iter(self.get_pkgnames, ignore_errors):
+      yield pkgdir.name, pkgnames
+
+def iter_lilac_info(
+  repodir: Path, ignore_errors: bool = False,
+) -> Iterator[LilacInfo]:
+  '''iterate over all packages in repodir using the default cache'''
+  with LilacCache(repodir) as cache:
+    yield from cache.iter(ignore_errors)
+
+def iter_pkgnames(
+  repodir: Path, ignore_errors: bool = False,
+) -> Iterator[tuple[str, list[str]]]:
+  '''(pkgbase, pkgnames) for all packages in repodir using the default cache'''
+  with LilacCache(repodir) as cache:
+    yield from cache.iter_pkgnames(ignore_errors)
@@ -3,14 +3,17 @@ from __future__ import annotations
 import asyncio
 from typing import List
 import pathlib
+import sys
+import os
 
-from lilac2.lilacyaml import (
-  iter_pkgdir, load_lilac_yaml,
-)
+from lilac2.lilacyaml import load_lilac_yaml
 
 from .config import REPODIR
 from .util import Dependent, Maintainer
 
+sys.path.append(os.path.join(os.path.dirname(__file__), '../pylib'))
+import lilaccache
+
 async def find_maintainers(
   pkgbase: str,
 ) -> List[Maintainer]:
@@ -49,17 +52,11 @@ def find_dependent_packages_ext(
   target: str,
 ) -> List[Dependent]:
   ret = []
-  for x in iter_pkgdir(repo):
-    try:
-      ly = load_lilac_yaml(x)
-    except Exception:
-      # ignore wrong packages
-      continue
-    for d, _ in ly.get('repo_depends', ()):
+  # ignore wrong packages
+  for x in lilaccache.iter_lilac_info(repo, ignore_errors=True):
+    for d, _ in x.repo_depends:
       if d == target:
-        maints = [x['github'] for x in
-                  ly.get('maintainers', ())
-                  if 'github' in x]
-        ret.append(Dependent(x.name, maints))
+        maints = [Maintainer(m) for m in x.maintainers]
+        ret.append(Dependent(x.pkgbase, maints))
   return ret
 
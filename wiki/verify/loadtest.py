@@ -0,0 +1,93 @@
+#!/usr/bin/python
+
+'''
+Load test the verify endpoint against a local stand-in siteverify endpoint.
+'''
+
+import asyncio
+import json
+import time
+import random
+
+import tornado.web
+from tornado.httpserver import HTTPServer
+from tornado.httpclient import AsyncHTTPClient, HTTPRequest
+from tornado.simple_httpclient import SimpleAsyncHTTPClient
+
+import verifyapi
+
+class SiteVerifyHandler(tornado.web.RequestHandler):
+  async def post(self):
+    await asyncio.sleep(self.settings['delay'])
+    self.finish(json.dumps({'success': True, 'hostname': 'wiki.example.org'}))
+
+async def main(args):
+  upstream = tornado.web.Application(
+    [(r'/siteverify', SiteVerifyHandler)],
+    delay = args.upstream_delay,
+  )
+  HTTPServer(upstream).listen(args.port + 1, '127.0.0.1')
+
+  config = {
+    'recaptcha_key': 'secret',
+    'fernet_key': 'qHAPHM8qg_ys6A0XPIyjqVsCTWzqyjzsaLc4wkmttrQ=',
+    'valid_domains': ['wiki.example.org'],
+    'siteverify_url': f'http://127.0.0.1:{args.port + 1}/siteverify',
+    'max_clients': args.max_clients,
+    'verify_cache_ttl': args.cache_ttl,
+  }
+  app = verifyapi.make_app(config)
+  HTTPServer(app, xheaders=True).listen(args.port, '127.0.0.1')
+
+  # the load generator shouldn't share the server's curl client
+  client = SimpleAsyncHTTPClient(force_instance=True, max_clients=args.concurrency)
+  sem = asyncio.Semaphore(args.concurrency)
+  latencies = []
+
+  async def one():
+    ip = f'10.0.{random.randrange(256)}.{random.randrange(args.ips // 256 + 1)}'
+    req = HTTPRequest(
+      f'http://127.0.0.1:{args.port}/__verify',
+      method = 'POST', body = 'token',
+      headers = {'X-Real-IP': ip},
+    )
+    async with sem:
+      t = time.perf_counter()
+      res = await client.fetch(req)
+      latencies.append(time.perf_counter() - t)
+      assert json.loads(res.body)['status'] == 'ok'
+
+  t = time.perf_counter()
+  await asyncio.gather(*(one() for _ in range(args.n)))
+  elapsed = time.perf_counter() - t
+
+  latencies.sort()
+  def pct(p):
+    return latencies[min(len(latencies) - 1, int(len(latencies) * p))] * 1000
+  print(json.dumps({
+    'requests': args.n,
+    'rps': round(args.n / elapsed, 1),
+    'p50_ms': round(pct(0.5), 1),
+    'p90_ms': round(pct(0.9), 1),
+    'p99_ms': round(pct(0.99), 1),
+    'cached_ips': len(app.settings['verify_cache'].data),
+  }))
+  client.close()
+  AsyncHTTPClient().close()
+
+if __name__ == '__main__':
+  import argparse
+
+  parser = argparse.ArgumentParser(description=__doc__)
+  parser.add_argument('-n', type=int, default=5000, help='number of requests')
+  parser.add_argument('-c', '--concurrency', type=int, default=100)
+  parser.add_argument('--ips', type=int, default=2000,
+                      help='roughly how many distinct client IPs to use')
+  parser.add_argument('--port', type=int, default=3280)
+  parser.add_argument('--upstream-delay', type=float, default=0.05,
+                      help='how long the stand-in siteverify takes')
+  parser.add_argument('--max-clients', type=int, default=50)
+  parser.add_argument('--cache-ttl', type=float, default=300,
+                      help='0 disables the verification cache')
+  args = parser.parse_args()
+  asyncio.run(main(args))
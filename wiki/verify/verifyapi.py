@@ -4,51 +4,107 @@ import tomllib
 import asyncio
 import urllib.parse
 import json
+import time
+from collections import OrderedDict
 
 from cryptography import fernet
 import tornado.web
 from tornado.httpserver import HTTPServer
 from tornado.httpclient import AsyncHTTPClient
-AsyncHTTPClient.configure("tornado.curl_httpclient.CurlAsyncHTTPClient")
+
+SITEVERIFY_URL = 'https://challenges.cloudflare.com/turnstile/v0/siteverify'
+
+class VerifyCache:
+  '''
+  IPs verified recently, so that repeated tries don't all go upstream.
+
+  Failures aren't cached: tokens are single-use, so a new token has to be
+  checked even if an earlier one from the same (maybe shared) IP failed.
+  '''
+
+  def __init__(self, ttl, maxsize=100000):
+    self.ttl = ttl
+    self.maxsize = maxsize
+    self.data = OrderedDict()
+
+  def __contains__(self, ip):
+    r = self.data.get(ip)
+    if r is None:
+      return False
+    if r < time.monotonic():
+      del self.data[ip]
+      return False
+    return True
+
+  def add(self, ip):
+    if self.ttl <= 0:
+      return
+    self.data[ip] = time.monotonic() + self.ttl
+    self.data.move_to_end(ip)
+    while len(self.data) > self.maxsize:
+      self.data.popitem(last=False)
 
 class VerifyHandler(tornado.web.RequestHandler):
+  def set_verified_cookie(self, ip):
+    value = self.settings['fernet'].encrypt(ip.encode())
+    self.set_cookie('__v', value, expires_days=365, httponly=True)
+
   async def post(self):
     config = self.settings['config']
     token = self.request.body.decode()
+    ip = self.request.remote_ip
     if not token:
-      ip = self.request.remote_ip
-      f = fernet.Fernet(config['fernet_key'])
-      value = f.encrypt(ip.encode())
-      self.set_cookie('__v', value, expires_days=365, httponly=True)
+      self.set_verified_cookie(ip)
       r = 'ok'
       self.finish({'status': r})
       return
 
+    cache = self.settings['verify_cache']
+    ok = ip in cache
+    if not ok:
+      ok = await self.check_token(config, token)
+      if ok:
+        cache.add(ip)
+
+    if ok:
+      self.set_verified_cookie(ip)
+      r = 'ok'
+    else:
+      r = 'fail'
+    self.finish({'status': r})
+
+  async def check_token(self, config, token):
     httpclient = AsyncHTTPClient()
     recaptcha_req = [
       ("secret", config['recaptcha_key']),
       ("response", token),
     ]
     res = await httpclient.fetch(
-      'https://challenges.cloudflare.com/turnstile/v0/siteverify',
+      config.get('siteverify_url', SITEVERIFY_URL),
       method = 'POST',
       body = urllib.parse.urlencode(recaptcha_req),
+      connect_timeout = config.get('connect_timeout', 5),
+      request_timeout = config.get('request_timeout', 10),
     )
     j = json.loads(res.body)
-    if j['success'] and j['hostname'] in config['valid_domains']:
-      ip = self.request.remote_ip
-      f = fernet.Fernet(config['fernet_key'])
-      value = f.encrypt(ip.encode())
-      self.set_cookie('__v', value, expires_days=365, httponly=True)
-      r = 'ok'
-    else:
-      r = 'fail'
-    self.finish({'status': r})
+    return j['success'] and j['hostname'] in config['valid_domains']
 
 routes = [
   (r'/__verify', VerifyHandler),
 ]
 
+def make_app(config):
+  AsyncHTTPClient.configure(
+    "tornado.curl_httpclient.CurlAsyncHTTPClient",
+    max_clients = config.get('max_clients', 50),
+  )
+  return tornado.web.Application(
+    routes,
+    config = config,
+    fernet = fernet.Fernet(config['fernet_key']),
+    verify_cache = VerifyCache(config.get('verify_cache_ttl', 300)),
+  )
+
 async def main():
   import argparse
 
@@ -60,10 +116,7 @@ async def main():
   with open(args.config, 'rb') as f:
     config = tomllib.load(f)
 
-  application = tornado.web.Application(
-    routes,
-    config = config,
-  )
+  application = make_app(config)
   http_server = HTTPServer(application, xheaders=True)
   http_server.listen(config['listen_port'], config['listen_ip'])
   await asyncio.Event().wait()